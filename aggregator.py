@@ -2,6 +2,22 @@
 
 import os
 
+# Buffer size for report writes; large enough that typical reports hit disk in one syscall.
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# Per-item markdown templates, parsed once and filled via str.format_map.
+_WEB_TMPL = "- **URL:** {url}\n  - **Snippet:** {snippet}\n\n"
+_GROUPED_TMPL = "- **URL:** {url}\n  - **File Path:** {file_path}\n  - **Content Type:** {content_type}\n"
+_LOCAL_TMPL = "- **File:** {file_path}\n  - **Snippet:** {snippet}\n\n"
+_LOCAL_PAGE_TMPL = "- **File:** {file_path}\n  - **Page:** {page}\n  - **Snippet:** {snippet}\n\n"
+
+
+class _BlankDict(dict):
+    """dict whose missing keys render as empty strings in format_map."""
+    def __missing__(self, key):
+        return ""
+
+
 def aggregate_results(query_id, enhanced_query, web_results, local_results, final_answer, config,
                      grouped_web_results=None, previous_results=None, follow_up_conversation=None):
     """
@@ -15,54 +31,49 @@ def aggregate_results(query_id, enhanced_query, web_results, local_results, fina
 
     # 1) Save only the final answer to final_report.md
     final_report_path = os.path.join(output_dir, "final_report.md")
-    with open(final_report_path, "w", encoding="utf-8") as fr:
+    # Reports go to a .tmp sibling first and are renamed into place, so a crash never leaves a partial file
+    with open(final_report_path + ".tmp", "w", encoding="utf-8") as fr:
         fr.write("# Final Aggregated Answer (RAG)\n\n")
         fr.write(final_answer.strip() + "\n")
+    os.replace(final_report_path + ".tmp", final_report_path)
 
     # 2) Create the main aggregator file with final RAG answer at the top
     aggregator_path = os.path.join(output_dir, f"{query_id}_output.md")
-    with open(aggregator_path, "w", encoding="utf-8") as f:
-        f.write(f"# Aggregated Results for Query ID: {query_id}\n\n")
-
-        f.write("## Enhanced Query\n")
-        f.write(f"{enhanced_query}\n\n")
-        
-        
-        f.write(f"# Final Aggregated Answer (RAG)\n\n")
-        f.write(final_answer.strip() + "\n\n")
+    # Stream rows straight into a large write buffer instead of holding the whole report in memory.
+    with open(aggregator_path + ".tmp", "w", encoding="utf-8", buffering=_WRITE_BUFFER_SIZE) as f:
+        write = f.write
+        write(f"# Aggregated Results for Query ID: {query_id}\n\n")
+        write(f"## Enhanced Query\n{enhanced_query}\n\n")
+        write(f"# Final Aggregated Answer (RAG)\n\n{final_answer.strip()}\n\n")
 
-        f.write("## Web Search Results\n")
+        write("## Web Search Results\n")
         if web_results:
             for item in web_results:
-                f.write(f"- **URL:** {item.get('url', '')}\n")
-                f.write(f"  - **Snippet:** {item.get('snippet', '')}\n\n")
+                write(_WEB_TMPL.format_map(_BlankDict(item)))
         else:
-            f.write("_No web results found_\n\n")
+            write("_No web results found_\n\n")
 
         if grouped_web_results:
-            f.write("## Grouped Web Results by Domain\n")
-            for domain, items in grouped_web_results.items():
-                f.write(f"### Domain: {domain}\n")
-                for item in items:
-                    f.write(f"- **URL:** {item.get('url', '')}\n")
-                    f.write(f"  - **File Path:** {item.get('file_path', '')}\n")
-                    f.write(f"  - **Content Type:** {item.get('content_type', '')}\n")
-                f.write("\n")
+            sections = (
+                "### Domain: {}\n{}\n".format(
+                    domain,
+                    "".join(_GROUPED_TMPL.format_map(_BlankDict(item)) for item in items),
+                )
+                for domain, items in grouped_web_results.items()
+            )
+            write("## Grouped Web Results by Domain\n" + "".join(sections))
 
-        f.write("## Local Retrieval Results\n")
+        write("## Local Retrieval Results\n")
         for doc in local_results:
             meta = doc.get('metadata', {})
-            f.write(f"- **File:** {meta.get('file_path', '')}\n")
-            if 'page' in meta:
-                f.write(f"  - **Page:** {meta.get('page')}\n")
-            f.write(f"  - **Snippet:** {meta.get('snippet', '')}\n\n")
+            tmpl = _LOCAL_PAGE_TMPL if 'page' in meta else _LOCAL_TMPL
+            write(tmpl.format_map(_BlankDict(meta)))
 
         if previous_results:
-            f.write("## Previous Results Integrated\n")
-            f.write(previous_results.strip() + "\n\n")
+            write(f"## Previous Results Integrated\n{previous_results.strip()}\n\n")
 
         if follow_up_conversation:
-            f.write("## Follow-Up Conversation\n")
-            f.write(follow_up_conversation.strip() + "\n")
+            write(f"## Follow-Up Conversation\n{follow_up_conversation.strip()}\n")
+    os.replace(aggregator_path + ".tmp", aggregator_path)
 
     return aggregator_path
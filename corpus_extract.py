@@ -0,0 +1,125 @@
+# corpus_extract.py
+
+"""
+File reading for local corpora: text, PDF pages and images, with no model involved.
+Kept free of torch/transformers so spawned extraction workers only import fitz and PIL.
+"""
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+
+def _pdf_pages_to_images(doc, max_pages: int = 4, dpi: int = 144, target_px: int = None):
+    """
+    Render the first pages of an open fitz.Document as RGB PIL images straight from the
+    pixmap samples (no PNG round-trip).
+    If 'target_px' is set, the DPI is chosen per page so the long side is about that many pixels.
+    """
+    try:
+        pages = []
+        for i in range(min(max_pages, doc.page_count)):
+            page = doc.load_page(i)
+            page_dpi = dpi
+            if target_px:
+                long_side_pt = max(page.rect.width, page.rect.height) or 1
+                page_dpi = max(1, min(dpi, int(72 * target_px / long_side_pt)))
+            pix = page.get_pixmap(dpi=page_dpi, alpha=False)
+            img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+            pages.append(img)
+        return pages
+    except Exception:
+        return []
+
+
+def _open_image_for_encoder(file_path: str, min_side: int = 256) -> Image.Image:
+    """
+    Open an image as RGB, shrunk so its short side is about 'min_side' (siglip/clip resize to 224 anyway).
+    JPEGs are downscaled while decoding via draft(), so big photos are never decoded at full size.
+    """
+    img = Image.open(file_path)
+    w, h = img.size
+    scale = min_side / max(1, min(w, h))
+    if scale < 1:
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        img.draft("RGB", size)
+        img = img.convert("RGB")
+        if img.size != size:
+            img = img.resize(size, Image.BILINEAR)
+        return img
+    return img.convert("RGB")
+
+
+def _extract_file(file_path: str, filename: str, model_type: str):
+    """
+    Read one corpus file without touching the model.
+    Returns {'file_path', 'text', 'images'} or None if the file should be skipped.
+    """
+    ext = filename.lower()
+    text = ""
+    images = []
+
+    # --- TXT ---
+    if ext.endswith(".txt"):
+        try:
+            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+                text = f.read()
+        except Exception as e:
+            print(f"[WARN] Failed to read TXT {file_path}: {e}")
+            return None
+
+    # --- PDF ---
+    elif ext.endswith(".pdf"):
+        # Parse once; text and page images share the document
+        try:
+            doc = fitz.open(file_path)
+        except Exception as e:
+            print(f"[WARN] Failed to read PDF {file_path}: {e}")
+            doc = None
+
+        if doc is not None:
+            try:
+                # Extract text quickly
+                try:
+                    n_pages = min(10, doc.page_count)  # cap for speed
+                    text = "\n".join(filter(None, (
+                        doc.load_page(i).get_text("text", flags=fitz.TEXTFLAGS_TEXT).strip()
+                        for i in range(n_pages)
+                    )))
+                except Exception as e:
+                    print(f"[WARN] Failed to read PDF {file_path}: {e}")
+                    text = ""
+
+                # For VLMs, also embed first few pages as images (fast, no OCR)
+                if model_type in ("siglip", "clip"):
+                    # siglip/clip take 224px inputs; render near that size so the processor barely resizes
+                    images = _pdf_pages_to_images(doc, max_pages=4, target_px=256)
+            finally:
+                doc.close()
+
+    # --- Images ---
+    elif ext.endswith((".png", ".jpg", ".jpeg")):
+        if model_type in ("siglip", "clip"):
+            try:
+                images = [_open_image_for_encoder(file_path)]
+            except Exception as e:
+                print(f"[WARN] Image load failed {file_path}: {e}")
+                return None
+        else:
+            # Text-only models: use OCR fallback
+            try:
+                import pytesseract
+                img = Image.open(file_path)
+                text = pytesseract.image_to_string(img)
+            except Exception as e:
+                print(f"[WARN] OCR failed for image {file_path}: {e}")
+                return None
+    else:
+        # skip unsupported
+        return None
+
+    return {"file_path": file_path, "text": text, "images": images}
+
+
+def _extract_file_task(task):
+    file_path, filename, model_type = task
+    return _extract_file(file_path, filename, model_type)
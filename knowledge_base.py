@@ -1,10 +1,14 @@
 import os
-import io
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import torch
+import torch.nn.functional as F
 import numpy as np
-import fitz  # PyMuPDF
 from PIL import Image
 
+from corpus_extract import _extract_file_task
+
 ############################
 # Load & Configure Retrieval
 ############################
@@ -16,11 +20,44 @@ def _pick_dtype(device: str):
     return torch.float32
 
 
-def load_retrieval_model(model_choice="colpali", device="cpu"):
+def _compile_model(model, processor, model_type: str, device: str):
+    """
+    torch.compile the submodules our encode paths actually call.
+    siglip/clip are used through get_text_features/get_image_features, which bypass the top-level
+    forward, so their text/vision towers are compiled in place instead.
+    Compilation is lazy, so a warm-up encode runs here; if it fails the eager modules are restored.
+    """
+    if not hasattr(torch, "compile"):
+        print("[WARN] torch.compile unavailable in this torch version; running eagerly.")
+        return model
+    # CUDA graphs pay off on GPU; on CPU the default inductor mode is the safe choice
+    mode = "reduce-overhead" if device.startswith("cuda") else None
+    eager = model
+    eager_towers = None
+    try:
+        if model_type in ("siglip", "clip"):
+            eager_towers = (model.text_model, model.vision_model)
+            model.text_model = torch.compile(model.text_model, mode=mode, dynamic=True)
+            model.vision_model = torch.compile(model.vision_model, mode=mode, dynamic=True)
+            _encode_text_batch(["warm-up"], model, processor, model_type, device)
+            _encode_image_batch([Image.new("RGB", (224, 224))], model, processor, model_type, device)
+        elif model_type == "colpali":
+            model = torch.compile(model, mode=mode, dynamic=True)
+            _encode_text_batch(["warm-up"], model, processor, model_type, device)
+    except Exception as e:
+        print(f"[WARN] torch.compile failed for {model_type} ({e}); running eagerly.")
+        model = eager
+        if eager_towers is not None:
+            model.text_model, model.vision_model = eager_towers
+    return model
+
+
+def load_retrieval_model(model_choice="colpali", device="cpu", compile_model=False):
     """
     Backward-compatible loader with extra, faster VLM options.
     Returns: (model, processor, model_type)
     model_type equals model_choice, preserving your external behavior.
+    Set compile_model=True to torch.compile the transformer models (first calls are slower).
 
     Supported choices (additive over your original):
       - "siglip"  : google/siglip-base-patch16-224 (fast, multimodal)
@@ -61,80 +98,152 @@ def load_retrieval_model(model_choice="colpali", device="cpu"):
     else:
         raise ValueError(f"Unsupported retrieval model choice: {model_choice}")
 
+    if compile_model:
+        model = _compile_model(model, processor, model_type, device)
+
     return model, processor, model_type
 
 
 def _l2norm(x: torch.Tensor) -> torch.Tensor:
-    x = x.float()
-    return x / (x.norm(dim=-1, keepdim=True) + 1e-12)
+    return F.normalize(x.float(), dim=-1, eps=1e-12)
 
 
-def embed_text(query, model, processor, model_type="colpali", device="cpu"):
+def _encode_text_batch(texts, model, processor, model_type: str, device: str, to_cpu: bool = True) -> torch.Tensor:
     """
-    Backward-compatible. Always returns a torch.Tensor on CPU for uniformity.
+    Embed a list of strings in a single forward pass; returns L2-normalized [N, D],
+    on CPU unless to_cpu=False (then it stays on the model's device).
     """
-    with torch.no_grad():
+    emb = _encode_text_batch_on_device(texts, model, processor, model_type, device)
+    return emb.cpu() if to_cpu else emb
+
+
+def _encode_text_batch_on_device(texts, model, processor, model_type: str, device: str) -> torch.Tensor:
+    with torch.inference_mode():
         if model_type == "colpali":
             # Keep your original pathway (text → embeddings)
-            inputs = processor(text=[query], truncation=True, max_length=512, return_tensors="pt").to(device)
+            inputs = processor(text=texts, truncation=True, max_length=512, padding=True, return_tensors="pt").to(device)
             outputs = model(**inputs)
-            emb = outputs.embeddings.mean(dim=1).squeeze(0)
-            return _l2norm(emb).cpu()
+            # Mean over real tokens only, so padded rows match their unbatched embedding
+            mask = inputs["attention_mask"].unsqueeze(-1).float()
+            emb = (outputs.embeddings.float() * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1.0)
+            return _l2norm(emb)
 
         elif model_type == "all-minilm":
-            emb = model.encode(query, convert_to_tensor=True)
-            return _l2norm(emb).cpu()
+            emb = model.encode(texts, batch_size=len(texts), convert_to_tensor=True)
+            return _l2norm(emb)
 
         elif model_type == "siglip":
             # SigLIP provides aligned text/image spaces
             # get_text_features is available via forward helpers in HF >= 4.40
-            inputs = processor(text=[query], return_tensors="pt", padding=True, truncation=True, max_length=64).to(device)
+            # It pools the last position and was trained with max_length padding, so pad to 64 for batching
+            inputs = processor(text=texts, return_tensors="pt", padding="max_length", truncation=True, max_length=64).to(device)
             try:
                 emb = model.get_text_features(**inputs)
             except AttributeError:
                 # fallback to forward and pool
                 out = model(**inputs)
                 emb = out.text_embeds
-            emb = emb.squeeze(0)
-            return _l2norm(emb).cpu()
+            return _l2norm(emb)
 
         elif model_type == "clip":
-            inputs = processor(text=[query], return_tensors="pt", padding=True, truncation=True, max_length=77).to(device)
+            inputs = processor(text=texts, return_tensors="pt", padding=True, truncation=True, max_length=77).to(device)
             try:
                 emb = model.get_text_features(**inputs)
             except AttributeError:
                 out = model(**inputs)
                 emb = out.text_embeds
-            emb = emb.squeeze(0)
-            return _l2norm(emb).cpu()
+            return _l2norm(emb)
 
         else:
             raise ValueError(f"Unsupported model_type: {model_type}")
 
 
+def embed_text(query, model, processor, model_type="colpali", device="cpu"):
+    """
+    Backward-compatible. Always returns a torch.Tensor on CPU for uniformity.
+    """
+    return _encode_text_batch([query], model, processor, model_type, device)[0]
+
+
+def embed_texts(texts, model, processor, model_type="colpali", device="cpu", batch_size=32):
+    """
+    Batched embed_text: returns an [N, D] CPU tensor, one L2-normalized row per input.
+    An empty input returns an empty [0, 0] tensor without calling the model.
+    """
+    if len(texts) == 0:
+        return torch.empty((0, 0))
+    rows = [
+        _encode_text_batch(texts[i:i + batch_size], model, processor, model_type, device)
+        for i in range(0, len(texts), batch_size)
+    ]
+    return torch.cat(rows, dim=0)
+
+
 ##################
 # Scoring & Search
 ##################
 
-def late_interaction_score(query_emb, doc_emb):
-    q_vec = query_emb.view(-1)
-    d_vec = doc_emb.view(-1)
-    q_norm = q_vec / (q_vec.norm() + 1e-12)
-    d_norm = d_vec / (d_vec.norm() + 1e-12)
-    return float(torch.dot(q_norm, d_norm))
+def late_interaction_score(query_emb, doc_emb, renormalize=False):
+    """
+    Cosine similarity of two embeddings, computed as a plain dot product.
+    Both inputs must already be unit-norm (as embed_text / embed_texts output is); otherwise the
+    result is not a cosine score. Pass renormalize=True for arbitrary vectors.
+    """
+    q_vec = query_emb.reshape(-1).float()
+    d_vec = doc_emb.reshape(-1).float()
+    if renormalize:
+        q_vec = q_vec / (q_vec.norm() + 1e-12)
+        d_vec = d_vec / (d_vec.norm() + 1e-12)
+    return float(torch.dot(q_vec, d_vec))
+
+
+def build_corpus_matrix(corpus) -> torch.Tensor:
+    """Stack corpus embeddings into one L2-normalized [N, D] CPU matrix for scoring."""
+    return _l2norm(torch.stack([entry['embedding'].detach().reshape(-1).float().cpu() for entry in corpus]))
 
 
-def retrieve(query, corpus, model, processor, top_k=3, model_type="colpali", device="cpu", text_model=None):
+def quantize_int8(mat: torch.Tensor):
+    """
+    Symmetric per-row int8 quantization of an [N, D] matrix.
+    Returns (int8 [N, D], fp32 scales [N]) with mat ~= q * scales[:, None].
+    """
+    scales = mat.abs().amax(dim=-1).clamp(min=1e-12) / 127.0
+    q = (mat / scales[:, None]).round().clamp(-127, 127).to(torch.int8)
+    return q, scales
+
+
+def encode_query(query, model, processor, model_type="colpali", device="cpu", text_model=None) -> torch.Tensor:
+    """Embed a retrieval query; returns an L2-normalized [D] vector on CPU."""
     # Use text_model for query embedding when available (for hybrid vision+text models)
     if model_type in ["siglip", "clip"] and text_model:
         query_embedding = text_model.encode(query, convert_to_tensor=True)
     else:
         query_embedding = embed_text(query, model, processor, model_type=model_type, device=device)
-    scores = []
-    for entry in corpus:
-        score = late_interaction_score(query_embedding, entry['embedding'])
-        scores.append(score)
-    top_indices = np.argsort(scores)[-top_k:][::-1]
+    return _l2norm(query_embedding.detach().reshape(-1).float().cpu())
+
+
+def retrieve(query, corpus, model, processor, top_k=3, model_type="colpali", device="cpu", text_model=None,
+             corpus_matrix=None, corpus_scales=None, query_embedding=None):
+    """
+    Return the top_k corpus entries by cosine similarity to 'query'.
+    Pass 'corpus_matrix' (from build_corpus_matrix) to reuse a pre-stacked corpus across calls;
+    if it is int8 (from quantize_int8), pass its per-row 'corpus_scales' too.
+    Pass 'query_embedding' (from encode_query) to skip encoding the query.
+    """
+    if not corpus:
+        return []
+    if query_embedding is None:
+        query_embedding = encode_query(query, model, processor, model_type=model_type,
+                                       device=device, text_model=text_model)
+    if corpus_matrix is None:
+        corpus_matrix = build_corpus_matrix(corpus)
+    q = query_embedding
+    if corpus_scales is not None:
+        scores = (corpus_matrix.float() @ q) * corpus_scales
+    else:
+        scores = corpus_matrix @ q
+    k = max(0, min(top_k, scores.numel()))
+    top_indices = torch.topk(scores, k).indices.tolist()
     return [corpus[i] for i in top_indices]
 
 
@@ -149,8 +258,34 @@ def _pool_mean(tensors):
     return _l2norm(stacked.mean(dim=0))
 
 
-def _embed_long_text(text: str, model, processor, model_type: str, device: str, max_len=1200, stride=800):
-    """Chunk long text to keep memory bounded; mean-pool chunk embeddings."""
+# Per-window token budgets (encoder max length minus room for special tokens).
+# ColPaliProcessor wraps each text in BOS + "Question: " + 10 query-augmentation tokens + "\n",
+# so its window leaves ~20 tokens of headroom under max_length=512 to keep that suffix intact.
+_TEXT_WINDOW_TOKENS = {"siglip": 62, "clip": 75, "colpali": 490, "all-minilm": 254}
+
+
+def _get_fast_tokenizer(model, processor):
+    """Return the encoder's HF fast tokenizer, or None if it only has a slow one."""
+    tok = getattr(processor, "tokenizer", None) or getattr(model, "tokenizer", None)
+    return tok if getattr(tok, "is_fast", False) else None
+
+
+def _chunk_text(text: str, model_type: str, max_len=1200, stride=800, tokenizer=None):
+    """
+    Split long text into overlapping windows sized for the model's text encoder.
+    With a fast 'tokenizer', the text is tokenized once and windows fall on token boundaries
+    (each fits the encoder without truncation); otherwise falls back to character windows.
+    """
+    window = _TEXT_WINDOW_TOKENS.get(model_type)
+    if tokenizer is not None and window:
+        try:
+            enc = tokenizer(text, add_special_tokens=False, truncation=True, max_length=window,
+                            stride=window // 4, return_overflowing_tokens=True, return_offsets_mapping=True)
+            spans = [text[offsets[0][0]:offsets[-1][1]] for offsets in enc["offset_mapping"] if offsets]
+            return list(dict.fromkeys(spans))  # repeated windows (e.g. boilerplate) cost a forward each
+        except Exception as e:
+            print(f"[WARN] Token-based chunking failed ({e}); using character windows.")
+
     # Adjust max_len based on model type
     if model_type in ["siglip", "clip"]:
         max_len = 200  # Much shorter for vision models
@@ -158,143 +293,220 @@ def _embed_long_text(text: str, model, processor, model_type: str, device: str,
     elif model_type == "colpali":
         max_len = 400  # Medium for ColPali
         stride = 300
-    
+
     chunks = []
     i = 0
     while i < len(text):
-        chunk = text[i:i+max_len]
+        chunks.append(text[i:i+max_len])
+        if i + max_len >= len(text):
+            break  # this window reached the end; later ones would only be its suffixes
         i += stride
-        chunks.append(chunk)
-    embs = []
-    for c in chunks:
-        embs.append(embed_text(c, model, processor, model_type=model_type, device=device))
-    return _pool_mean(embs)
+    return list(dict.fromkeys(chunks))
 
 
-def _embed_image(img: Image.Image, model, processor, model_type: str, device: str):
-    with torch.no_grad():
-        if model_type == "siglip":
-            inputs = processor(images=img, return_tensors="pt").to(device)
-            try:
-                feats = model.get_image_features(**inputs)
-            except AttributeError:
-                out = model(**inputs)
-                feats = out.image_embeds
-            return _l2norm(feats.squeeze(0)).cpu()
-        elif model_type == "clip":
-            inputs = processor(images=img, return_tensors="pt").to(device)
-            try:
-                feats = model.get_image_features(**inputs)
-            except AttributeError:
-                out = model(**inputs)
-                feats = out.image_embeds
-            return _l2norm(feats.squeeze(0)).cpu()
-        else:
-            return None  # non-vision models
+def _encode_image_batch(imgs, model, processor, model_type: str, device: str, to_cpu: bool = True) -> torch.Tensor:
+    """Embed a list of PIL images in a single forward pass; returns L2-normalized [N, D] (see _encode_text_batch)."""
+    with torch.inference_mode():
+        inputs = processor(images=imgs, return_tensors="pt").to(device)
+        try:
+            feats = model.get_image_features(**inputs)
+        except AttributeError:
+            out = model(**inputs)
+            feats = out.image_embeds
+        emb = _l2norm(feats)
+    return emb.cpu() if to_cpu else emb
+
+
+def _embed_in_batches(items, encode_batch, batch_size: int):
+    """
+    Run encode_batch over items in slices of batch_size. Returns one embedding per item,
+    or None for items that could not be embedded. A failing batch is retried item by item
+    so one bad input does not drop its neighbours.
+    """
+    out = []
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        try:
+            out.extend(encode_batch(batch))
+        except Exception as e:
+            print(f"[WARN] Batched embedding failed, retrying one at a time: {e}")
+            for item in batch:
+                try:
+                    out.extend(encode_batch([item]))
+                except Exception as e:
+                    print(f"[WARN] Embedding failed for one input: {e}")
+                    out.append(None)
+    return out
+
+
+_MAX_EXTRACT_WORKERS = 4  # default cap; extraction is CPU-bound, the model still needs cores
+_MIN_PARALLEL_HEAVY_FILES = 8  # spawning workers costs seconds; below this many PDFs/images stay in-process
+_HEAVY_EXTS = (".pdf", ".png", ".jpg", ".jpeg")
+
+
+def _extract_files(tasks, num_workers=None):
+    """
+    Run _extract_file over (file_path, filename, model_type) tasks, in order.
+    PDF rasterization / text extraction / OCR is CPU-bound, so once there are at least
+    _MIN_PARALLEL_HEAVY_FILES PDFs/images the files are spread over worker processes;
+    smaller jobs, and a failing pool, run in the current process.
+    Workers are spawned, not forked: the parent already holds torch/OpenMP/tokenizers threads.
+    Each one re-imports the main module, which is why small jobs are not worth the startup.
+    """
+    n_heavy = sum(1 for _, filename, _ in tasks if filename.lower().endswith(_HEAVY_EXTS))
+    if num_workers is None:
+        num_workers = min(_MAX_EXTRACT_WORKERS, os.cpu_count() or 1)
+    num_workers = min(num_workers, len(tasks))
+    if num_workers > 1 and n_heavy >= _MIN_PARALLEL_HEAVY_FILES:
+        try:
+            with ProcessPoolExecutor(max_workers=num_workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as ex:
+                return list(ex.map(_extract_file_task, tasks, chunksize=4))
+        except Exception as e:
+            print(f"[WARN] Parallel extraction failed ({e}); extracting files sequentially.")
+    return [_extract_file_task(t) for t in tasks]
+
 
+_CORPUS_EXTS = (".txt", ".pdf", ".png", ".jpg", ".jpeg")
+_EMBED_CACHE_DIR = ".nanosage_cache"
+_EMBED_CACHE_VERSION = 4  # bump when chunking/pooling changes so stale embeddings are not reused
 
-def _pdf_pages_to_images(pdf_path: str, max_pages: int = 4, dpi: int = 144):
+
+def _file_digest(file_path: str) -> str:
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _embed_cache_path(cache_dir: str, digest: str, model_type: str) -> str:
+    return os.path.join(cache_dir, f"{digest}_{model_type}_v{_EMBED_CACHE_VERSION}.npz")
+
+
+def _load_cached_embedding(cache_path: str):
+    """Return (embedding, snippet) from a cache file, or None if missing/unreadable."""
     try:
-        doc = fitz.open(pdf_path)
-        pages = []
-        for i, page in enumerate(doc):
-            if i >= max_pages:
-                break
-            pix = page.get_pixmap(dpi=dpi)
-            img = Image.open(io.BytesIO(pix.tobytes("png"))).convert("RGB")
-            pages.append(img)
-        return pages
-    except Exception:
-        return []
+        with np.load(cache_path, allow_pickle=False) as data:
+            return torch.from_numpy(data["embedding"].copy()), str(data["snippet"])
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[WARN] Ignoring unreadable embedding cache {cache_path}: {e}")
+        return None
+
+
+def _save_cached_embedding(cache_path: str, embedding: torch.Tensor, snippet: str):
+    tmp_path = cache_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, embedding=embedding.numpy(), snippet=np.array(snippet))
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"[WARN] Failed to write embedding cache {cache_path}: {e}")
 
 
-def load_corpus_from_dir(corpus_dir, model, processor, device="cpu", model_type="colpali"):
+def load_corpus_from_dir(corpus_dir, model, processor, device="cpu", model_type="colpali", batch_size=32,
+                         use_cache=True, num_workers=None):
     """
     Scan 'corpus_dir' for txt, pdf, and image files, embed their content,
     and return a list of { 'embedding': torch.Tensor(cpu), 'metadata':... }.
     - For VLMs (siglip/clip): images & PDF pages are embedded directly (no OCR needed).
     - For text-only models: text is extracted (OCR for images as fallback) and embedded.
     - PDFs: combine (mean-pool) text chunks + first few rendered pages (VLMs) for robustness.
+    Text chunks and images from all files are embedded together in batches of 'batch_size'.
+    With 'use_cache', final embeddings are stored under corpus_dir/.nanosage_cache/ keyed by
+    file content hash and model type, so unchanged files are not re-embedded on the next run.
+    File reading runs in 'num_workers' spawned processes (default: min(4, os.cpu_count())) once
+    enough PDFs/images miss the cache to pay for worker startup; otherwise it stays in-process.
     """
     corpus = []
     if not corpus_dir or not os.path.isdir(corpus_dir):
         return corpus
 
-    for filename in os.listdir(corpus_dir):
-        file_path = os.path.join(corpus_dir, filename)
-        if not os.path.isfile(file_path):
-            continue
-
-        ext = filename.lower()
-        text = ""
-        img_embs = []
-
-        # --- TXT ---
-        if ext.endswith(".txt"):
+    cache_dir = None
+    if use_cache:
+        cache_dir = os.path.join(corpus_dir, _EMBED_CACHE_DIR)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError as e:
+            print(f"[WARN] Embedding cache disabled, cannot create {cache_dir}: {e}")
+            cache_dir = None
+
+    # Pass 1: read every file (or its cached embedding); no model calls yet
+    jobs = []
+    pending = []  # (index into jobs, task) for files that need extraction
+    with os.scandir(corpus_dir) as it:
+        entries = [(entry.path, entry.name) for entry in it
+                   if entry.name.lower().endswith(_CORPUS_EXTS) and entry.is_file()]
+    for file_path, filename in entries:
+        cache_path = None
+        if cache_dir:
             try:
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                    text = f.read()
-            except Exception as e:
-                print(f"[WARN] Failed to read TXT {file_path}: {e}")
+                cache_path = _embed_cache_path(cache_dir, _file_digest(file_path), model_type)
+            except OSError as e:
+                print(f"[WARN] Failed to hash {file_path}: {e}")
+            cached = _load_cached_embedding(cache_path) if cache_path else None
+            if cached is not None:
+                emb, snippet = cached
+                jobs.append({"file_path": file_path, "text": "", "images": [], "cache_path": None,
+                             "entry": {
+                                 "embedding": emb,
+                                 "metadata": {"file_path": file_path, "type": "local", "snippet": snippet}
+                             }})
                 continue
 
-        # --- PDF ---
-        elif ext.endswith(".pdf"):
-            # Extract text quickly
-            try:
-                doc = fitz.open(file_path)
-                tparts = []
-                for i, page in enumerate(doc):
-                    if i >= 10:  # cap for speed
-                        break
-                    t = page.get_text("text").strip()
-                    if not t:
-                        t = page.get_text("blocks").strip() or ""
-                    if t:
-                        tparts.append(t)
-                text = "\n".join(tparts)
-            except Exception as e:
-                print(f"[WARN] Failed to read PDF {file_path}: {e}")
-                text = ""
-
-            # For VLMs, also embed first few pages as images (fast, no OCR)
-            if model_type in ("siglip", "clip"):
-                for img in _pdf_pages_to_images(file_path, max_pages=4):
-                    e = _embed_image(img, model, processor, model_type, device)
-                    if e is not None:
-                        img_embs.append(e)
-
-        # --- Images ---
-        elif ext.endswith((".png", ".jpg", ".jpeg")):
-            if model_type in ("siglip", "clip"):
-                try:
-                    img = Image.open(file_path).convert("RGB")
-                    e = _embed_image(img, model, processor, model_type, device)
-                    if e is not None:
-                        img_embs.append(e)
-                except Exception as e:
-                    print(f"[WARN] Image load failed {file_path}: {e}")
-                    continue
-            else:
-                # Text-only models: use OCR fallback
-                try:
-                    import pytesseract
-                    img = Image.open(file_path)
-                    text = pytesseract.image_to_string(img)
-                except Exception as e:
-                    print(f"[WARN] OCR failed for image {file_path}: {e}")
-                    continue
-        else:
-            # skip unsupported
+        pending.append((len(jobs), (file_path, filename, model_type)))
+        jobs.append({"cache_path": cache_path})
+
+    extracted = _extract_files([task for _, task in pending], num_workers)
+    for (j, _), job in zip(pending, extracted):
+        if job is not None:
+            jobs[j].update(job)
+    jobs = [job for job in jobs if "file_path" in job]
+
+    # Pass 2: flatten chunks/images across files and embed them in batches
+    texts, text_owner = [], []
+    images, image_owner = [], []
+    tokenizer = _get_fast_tokenizer(model, processor)
+    for j, job in enumerate(jobs):
+        if job["text"].strip():
+            for chunk in _chunk_text(job["text"], model_type, tokenizer=tokenizer):
+                texts.append(chunk)
+                text_owner.append(j)
+        for img in job["images"]:
+            images.append(img)
+            image_owner.append(j)
+
+    text_embs = _embed_in_batches(
+        texts, lambda b: _encode_text_batch(b, model, processor, model_type, device, to_cpu=False), batch_size)
+    image_embs = []
+    if model_type in ("siglip", "clip"):
+        image_embs = _embed_in_batches(
+            images, lambda b: _encode_image_batch(b, model, processor, model_type, device, to_cpu=False), batch_size)
+
+    chunk_embs_by_job = [[] for _ in jobs]
+    image_embs_by_job = [[] for _ in jobs]
+    for j, e in zip(text_owner, text_embs):
+        if e is not None:
+            chunk_embs_by_job[j].append(e)
+    for j, e in zip(image_owner, image_embs):
+        if e is not None:
+            image_embs_by_job[j].append(e)
+
+    # Build final embedding per file (still on the model's device)
+    built = []  # (index into corpus, final embedding, cache path)
+    for job, chunk_embs, img_embs in zip(jobs, chunk_embs_by_job, image_embs_by_job):
+        if "entry" in job:
+            corpus.append(job["entry"])
             continue
-
-        # Build final embedding
+        file_path = job["file_path"]
+        text = job["text"]
         try:
             embs = []
-            if text.strip():
-                text_emb = _embed_long_text(text, model, processor, model_type, device)
-                if text_emb is not None:
-                    embs.append(text_emb)
+            text_emb = _pool_mean(chunk_embs)
+            if text_emb is not None:
+                embs.append(text_emb)
             embs.extend(img_embs)
 
             if not embs:
@@ -304,8 +516,9 @@ def load_corpus_from_dir(corpus_dir, model, processor, device="cpu", model_type=
             final_emb = _pool_mean(embs)
             snippet = (text[:100].replace('\n', ' ') + "...") if text else ""
 
+            built.append((len(corpus), final_emb, job["cache_path"]))
             corpus.append({
-                "embedding": final_emb.cpu(),
+                "embedding": None,  # filled in below
                 "metadata": {
                     "file_path": file_path,
                     "type": "local",
@@ -315,6 +528,14 @@ def load_corpus_from_dir(corpus_dir, model, processor, device="cpu", model_type=
         except Exception as e:
             print(f"[WARN] Skipping embedding for local file {file_path} due to error: {e}")
 
+    # One device -> host copy for every newly embedded file
+    if built:
+        cpu_embs = torch.stack([emb for _, emb, _ in built]).cpu()
+        for (idx, _, cache_path), emb in zip(built, cpu_embs):
+            corpus[idx]["embedding"] = emb
+            if cache_path:
+                _save_cached_embedding(cache_path, emb, corpus[idx]["metadata"]["snippet"])
+
     return corpus
 
 
@@ -326,18 +547,48 @@ class KnowledgeBase:
     """
     Same public API, faster VLM support under the hood.
     """
-    def __init__(self, model, processor, model_type="colpali", device="cpu", text_model=None):
+    QUERY_CACHE_SIZE = 512
+    def __init__(self, model, processor, model_type="colpali", device="cpu", text_model=None, quantize=False):
         self.model = model
         self.processor = processor
         self.model_type = model_type
         self.device = device
         self.text_model = text_model  # For hybrid vision+text models
+        self.quantize = quantize  # keep the scoring matrix as int8 + per-row scales (4x smaller)
         self.corpus = []
+        self._matrix = None  # normalized [N, D] view of corpus embeddings, rebuilt lazily
+        self._scales = None  # per-row scales when self._matrix is int8
+        self._query_cache = {}  # query -> normalized embedding; insertion order gives FIFO eviction
+
+    def _encode_query(self, query):
+        emb = self._query_cache.get(query)
+        if emb is None:
+            emb = encode_query(query, self.model, self.processor, model_type=self.model_type,
+                               device=self.device, text_model=self.text_model)
+            if len(self._query_cache) >= self.QUERY_CACHE_SIZE:
+                del self._query_cache[next(iter(self._query_cache))]
+            self._query_cache[query] = emb
+        return emb
 
     def add_documents(self, entries):
+        entries = list(entries)
         self.corpus.extend(entries)
+        if self._matrix is None or not entries:
+            return  # first search builds the whole matrix
+        # Append rows for the new entries only (like an index add) instead of restacking the corpus
+        rows = build_corpus_matrix(entries)
+        if self.quantize:
+            rows, scales = quantize_int8(rows)
+            self._scales = torch.cat([self._scales, scales])
+        self._matrix = torch.cat([self._matrix, rows])
 
     def search(self, query, top_k=3):
+        if not self.corpus:
+            return []
+        if self._matrix is None or self._matrix.shape[0] != len(self.corpus):
+            self._matrix = build_corpus_matrix(self.corpus)
+            if self.quantize:
+                self._matrix, self._scales = quantize_int8(self._matrix)
         return retrieve(
             query,
             self.corpus,
@@ -346,5 +597,8 @@ class KnowledgeBase:
             top_k=top_k,
             model_type=self.model_type,
             device=self.device,
-            text_model=self.text_model
+            text_model=self.text_model,
+            corpus_matrix=self._matrix,
+            corpus_scales=self._scales,
+            query_embedding=self._encode_query(query)
         )
@@ -1,10 +1,14 @@
 # llm_interface.py
 
 import os
-import time
+import re
 from abc import ABC, abstractmethod
 from typing import Optional, Dict, Any
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+# Text after the last marker on the first line that has one
+_FINAL_QUERY_RE = re.compile(r'Final Enhanced Query:(?!.*Final Enhanced Query:)(.*)')
 
 class LLMProvider(ABC):
     """Abstract base class for LLM providers."""
@@ -177,7 +181,7 @@ class LLMManager:
         """Get information about the current provider."""
         return self.provider.get_provider_name()
     
-    def summarize_text(self, text: str, max_chars: int = 6000) -> str:
+    def summarize_text(self, text: str, max_chars: int = 6000, max_workers: int = 4) -> str:
         """Summarize text with automatic chunking for long content."""
         if len(text) <= max_chars:
             prompt = f"Please summarize the following text succinctly:\n\n{text}"
@@ -185,13 +189,11 @@ class LLMManager:
         
         # If text is longer than max_chars, chunk it
         chunks = [text[i:i+max_chars] for i in range(0, len(text), max_chars)]
-        summaries = []
+        prompts = [f"Summarize part {i+1}/{len(chunks)}:\n\n{chunk}" for i, chunk in enumerate(chunks)]
         
-        for i, chunk in enumerate(chunks):
-            prompt = f"Summarize part {i+1}/{len(chunks)}:\n\n{chunk}"
-            summary = self.generate(prompt)
-            summaries.append(summary)
-            time.sleep(1)  # Rate limiting
+        # Chunk summaries are independent; at most max_workers requests are in flight at once
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(prompts)))) as ex:
+            summaries = list(ex.map(self.generate, prompts))
         
         combined = "\n".join(summaries)
         if len(combined) > max_chars:
@@ -218,12 +220,8 @@ class LLMManager:
     
     def _extract_final_query(self, text: str) -> str:
         """Extract the final enhanced query from the response."""
-        import re
-        lines = text.split('\n')
-        for line in lines:
-            if 'Final Enhanced Query:' in line:
-                return line.split('Final Enhanced Query:')[-1].strip()
-        return text.strip()
+        m = _FINAL_QUERY_RE.search(text)
+        return m.group(1).strip() if m else text.strip()
     
     def generate_final_answer(self, aggregation_prompt: str) -> str:
         """Generate the final RAG answer."""
@@ -246,28 +244,39 @@ def create_llm_manager(provider: str = "ollama", model: str = "gemma2:2b",
     }
     return LLMManager(config)
 
+# Managers for the backward-compat helpers, reused across calls (keyed by model, personality)
+_DEFAULT_MANAGERS: Dict[tuple, LLMManager] = {}
+
+def _default_manager(model: str = "gemma2:2b", personality: Optional[str] = None) -> LLMManager:
+    """Return a shared Ollama manager instead of building a new provider per call."""
+    key = (model, personality)
+    manager = _DEFAULT_MANAGERS.get(key)
+    if manager is None:
+        manager = _DEFAULT_MANAGERS[key] = create_llm_manager("ollama", model, personality)
+    return manager
+
 # Backward compatibility functions
 def call_gemma(prompt: str, model: str = "gemma2:2b", personality: Optional[str] = None) -> str:
     """Backward compatibility function for call_gemma."""
-    manager = create_llm_manager("ollama", model, personality)
+    manager = _default_manager(model, personality)
     return manager.generate(prompt)
 
 def rag_final_answer(aggregation_prompt: str, rag_model: str = "gemma", personality: Optional[str] = None) -> str:
     """Backward compatibility function for rag_final_answer."""
-    manager = create_llm_manager("ollama", "gemma2:2b", personality)
+    manager = _default_manager("gemma2:2b", personality)
     return manager.generate_final_answer(aggregation_prompt)
 
 def summarize_text(text: str, max_chars: int = 6000, personality: Optional[str] = None) -> str:
     """Backward compatibility function for summarize_text."""
-    manager = create_llm_manager("ollama", "gemma2:2b", personality)
+    manager = _default_manager("gemma2:2b", personality)
     return manager.summarize_text(text, max_chars)
 
 def chain_of_thought_query_enhancement(query: str, personality: Optional[str] = None) -> str:
     """Backward compatibility function for chain_of_thought_query_enhancement."""
-    manager = create_llm_manager("ollama", "gemma2:2b", personality)
+    manager = _default_manager("gemma2:2b", personality)
     return manager.enhance_query(query)
 
 def follow_up_conversation(follow_up_prompt: str, personality: Optional[str] = None) -> str:
     """Backward compatibility function for follow_up_conversation."""
-    manager = create_llm_manager("ollama", "gemma2:2b", personality)
+    manager = _default_manager("gemma2:2b", personality)
     return manager.follow_up_conversation(follow_up_prompt)
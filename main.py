@@ -3,15 +3,20 @@
 import argparse
 import asyncio
 import yaml
-import os
+
+try:
+    from yaml import CSafeLoader as SafeLoader  # libyaml-backed parser when available
+except ImportError:
+    from yaml import SafeLoader
 
 from search_session import SearchSession
 
 def load_config(config_path):
-    if not os.path.isfile(config_path):
+    try:
+        with open(config_path, "r") as f:
+            return yaml.load(f, Loader=SafeLoader)
+    except (FileNotFoundError, IsADirectoryError):
         return {}
-    with open(config_path, "r") as f:
-        return yaml.safe_load(f)
 
 def main():
     parser = argparse.ArgumentParser(description="Multi-step RAG pipeline with depth-limited searching.")
@@ -2,32 +2,43 @@
 
 import os
 import uuid
+import hashlib
+import contextlib
 import asyncio
 import time
 import re
-import random
 import yaml
+import numpy as np
 import torch
+import torch.nn.functional as F
 from datetime import datetime
+from urllib.parse import urlparse
 
-from knowledge_base import KnowledgeBase, late_interaction_score, load_corpus_from_dir, load_retrieval_model, embed_text
+from knowledge_base import KnowledgeBase, load_corpus_from_dir, load_retrieval_model, embed_texts
 from web_crawler import search_and_download, parse_any_to_text, sanitize_filename
 import json
 from aggregator import aggregate_results
 
+try:
+    import orjson  # native encoder for the TOC export when available
+except ImportError:
+    orjson = None
+
 #############################################
 # LLM Interface - Modular provider system
 #############################################
 
 from llm_interface import LLMManager, create_llm_manager
 
+_MARKDOWN_RE = re.compile(r'[\*\_`]')
+_WS_RE = re.compile(r'\s+')
+_QUOTE_TRANS = str.maketrans('', '', '"\'')
+
 def clean_search_query(query):
-    query = re.sub(r'[\*\_`]', '', query)
-    query = re.sub(r'\s+', ' ', query)
-    return query.strip()
+    return _WS_RE.sub(' ', _MARKDOWN_RE.sub('', query)).strip()
 
 def split_query(query, max_len=200):
-    query = query.replace('"', '').replace("'", "")
+    query = query.translate(_QUOTE_TRANS)
     sentences = query.split('.')
     subqueries = []
     current = ""
@@ -51,6 +62,11 @@ def split_query(query, max_len=200):
 ##############################################
 
 class TOCNode:
+    # Sessions allocate many nodes; slots drop the per-instance __dict__
+    __slots__ = ('query_text', 'depth', 'summary', 'web_results', 'corpus_entries', 'children',
+                 'relevance_score', 'timestamps', 'metrics', 'similarity_scores', 'parent_query',
+                 'node_id', '_sim_sum', '_sim_min', '_sim_max')
+
     def __init__(self, query_text, depth=1):
         self.query_text = query_text      # The subquery text for this branch
         self.depth = depth                # Depth level in the tree
@@ -81,6 +97,9 @@ class TOCNode:
             'subquery_expansion_count': 0
         }
         self.similarity_scores = []       # Individual similarity scores for debugging
+        self._sim_sum = 0.0               # Running aggregates so add_similarity_score stays O(1)
+        self._sim_min = float("inf")
+        self._sim_max = float("-inf")
         self.parent_query = None          # Reference to parent query for context
         self.node_id = None               # Unique identifier for this node
 
@@ -90,6 +109,19 @@ class TOCNode:
 
     def to_dict(self):
         """Convert TOCNode to dictionary for JSON serialization"""
+        # Iterative walk: deep trees neither hit the recursion limit nor pay a frame per node
+        root = self._shallow_dict()
+        stack = [(self, root)]
+        while stack:
+            node, node_dict = stack.pop()
+            for child in node.children:
+                child_dict = child._shallow_dict()
+                node_dict['children'].append(child_dict)
+                stack.append((child, child_dict))
+        return root
+
+    def _shallow_dict(self):
+        """This node's fields with an empty 'children' list for to_dict to fill."""
         return {
             'node_id': self.node_id,
             'query_text': self.query_text,
@@ -103,7 +135,7 @@ class TOCNode:
             'web_results_count': len(self.web_results),
             'corpus_entries_count': len(self.corpus_entries),
             'children_count': len(self.children),
-            'children': [child.to_dict() for child in self.children] if self.children else []
+            'children': []
         }
 
     def update_metrics(self, **kwargs):
@@ -115,26 +147,31 @@ class TOCNode:
     def add_similarity_score(self, score):
         """Add a similarity score and update statistics"""
         self.similarity_scores.append(score)
-        if self.similarity_scores:
-            self.metrics['avg_similarity_score'] = sum(self.similarity_scores) / len(self.similarity_scores)
-            self.metrics['max_similarity_score'] = max(self.similarity_scores)
-            self.metrics['min_similarity_score'] = min(self.similarity_scores)
+        self._sim_sum += score
+        if score < self._sim_min:
+            self._sim_min = score
+        if score > self._sim_max:
+            self._sim_max = score
+        self.metrics['avg_similarity_score'] = self._sim_sum / len(self.similarity_scores)
+        self.metrics['max_similarity_score'] = self._sim_max
+        self.metrics['min_similarity_score'] = self._sim_min
 
     def __repr__(self):
         return f"TOCNode(query_text='{self.query_text}', depth={self.depth}, relevance_score={self.relevance_score:.2f}, children={len(self.children)}, metrics={self.metrics})"
 
 def build_toc_string(toc_nodes, indent=0):
     """
-    Recursively build a string representation of the TOC tree.
+    Build a string representation of the TOC tree (pre-order, children indented).
     """
-    toc_str = ""
-    for node in toc_nodes:
-        prefix = "  " * indent + "- "
+    parts = []
+    stack = [(node, indent) for node in reversed(toc_nodes)]
+    while stack:
+        node, level = stack.pop()
+        prefix = "  " * level + "- "
         summary_snippet = (node.summary[:150] + "...") if node.summary else "No summary"
-        toc_str += f"{prefix}{node.query_text} (Relevance: {node.relevance_score:.2f}, Summary: {summary_snippet})\n"
-        if node.children:
-            toc_str += build_toc_string(node.children, indent=indent+1)
-    return toc_str
+        parts.append(f"{prefix}{node.query_text} (Relevance: {node.relevance_score:.2f}, Summary: {summary_snippet})\n")
+        stack.extend((child, level + 1) for child in reversed(node.children))
+    return "".join(parts)
 
 def analyze_toc_tree(toc_nodes):
     """
@@ -143,27 +180,34 @@ def analyze_toc_tree(toc_nodes):
     if not toc_nodes:
         return {}
     
-    def collect_all_nodes(nodes, all_nodes=None):
-        if all_nodes is None:
-            all_nodes = []
-        for node in nodes:
+    def collect_all_nodes(nodes):
+        # Pre-order, same as the old recursive walk; reversed pushes keep sibling order
+        all_nodes = []
+        stack = list(reversed(nodes))
+        while stack:
+            node = stack.pop()
             all_nodes.append(node)
-            if node.children:
-                collect_all_nodes(node.children, all_nodes)
+            stack.extend(reversed(node.children))
         return all_nodes
     
     all_nodes = collect_all_nodes(toc_nodes)
     
-    # Calculate tree statistics
+    # Flatten per-node numbers once; numpy does the aggregates in C
     total_nodes = len(all_nodes)
-    max_depth = max(node.depth for node in all_nodes) if all_nodes else 0
-    avg_depth = sum(node.depth for node in all_nodes) / total_nodes if total_nodes else 0
+    depths = np.fromiter((node.depth for node in all_nodes), dtype=np.int64, count=total_nodes)
+    relevance_scores = np.fromiter((node.relevance_score for node in all_nodes), dtype=np.float64, count=total_nodes)
+    processing_times = np.fromiter((node.metrics.get('processing_time_ms', 0) for node in all_nodes),
+                                   dtype=np.int64, count=total_nodes)
+
+    # Calculate tree statistics
+    max_depth = int(depths.max())
+    avg_depth = float(depths.mean())
     
     # Calculate relevance statistics
-    relevance_scores = [node.relevance_score for node in all_nodes]
-    avg_relevance = sum(relevance_scores) / len(relevance_scores) if relevance_scores else 0
-    max_relevance = max(relevance_scores) if relevance_scores else 0
-    min_relevance = min(relevance_scores) if relevance_scores else 0
+    avg_relevance = float(relevance_scores.mean())
+    max_relevance = float(relevance_scores.max())
+    min_relevance = float(relevance_scores.min())
+    relevance_std = float(relevance_scores.std())
     
     # Calculate Monte Carlo statistics
     monte_carlo_selected = sum(1 for node in all_nodes if node.metrics.get('monte_carlo_selected', False))
@@ -175,22 +219,20 @@ def analyze_toc_tree(toc_nodes):
     total_content_length = sum(node.metrics.get('total_content_length', 0) for node in all_nodes)
     
     # Calculate timing statistics
-    processing_times = [node.metrics.get('processing_time_ms', 0) for node in all_nodes]
-    total_processing_time = sum(processing_times)
+    total_processing_time = int(processing_times.sum())
     avg_processing_time = total_processing_time / total_nodes if total_nodes else 0
     
     # Calculate similarity statistics
-    all_similarity_scores = []
-    for node in all_nodes:
-        all_similarity_scores.extend(node.similarity_scores)
+    similarity_arrays = [np.asarray(node.similarity_scores, dtype=np.float64) for node in all_nodes if node.similarity_scores]
     
     similarity_stats = {}
-    if all_similarity_scores:
+    if similarity_arrays:
+        all_similarity_scores = np.concatenate(similarity_arrays)
         similarity_stats = {
-            'avg_similarity': sum(all_similarity_scores) / len(all_similarity_scores),
-            'max_similarity': max(all_similarity_scores),
-            'min_similarity': min(all_similarity_scores),
-            'total_similarity_measurements': len(all_similarity_scores)
+            'avg_similarity': float(all_similarity_scores.mean()),
+            'max_similarity': float(all_similarity_scores.max()),
+            'min_similarity': float(all_similarity_scores.min()),
+            'total_similarity_measurements': int(all_similarity_scores.size)
         }
     
     # Calculate branching factor
@@ -209,7 +251,7 @@ def analyze_toc_tree(toc_nodes):
             'avg_relevance': round(avg_relevance, 3),
             'max_relevance': round(max_relevance, 3),
             'min_relevance': round(min_relevance, 3),
-            'relevance_std': round((sum((x - avg_relevance) ** 2 for x in relevance_scores) / len(relevance_scores)) ** 0.5, 3) if relevance_scores else 0
+            'relevance_std': round(relevance_std, 3)
         },
         'monte_carlo_metrics': {
             'selected_nodes': monte_carlo_selected,
@@ -225,8 +267,8 @@ def analyze_toc_tree(toc_nodes):
         'timing_metrics': {
             'total_processing_time_ms': total_processing_time,
             'avg_processing_time_ms': round(avg_processing_time, 2),
-            'max_processing_time_ms': max(processing_times) if processing_times else 0,
-            'min_processing_time_ms': min(processing_times) if processing_times else 0
+            'max_processing_time_ms': int(processing_times.max()),
+            'min_processing_time_ms': int(processing_times.min())
         },
         'similarity_metrics': similarity_stats,
         'generated_at': datetime.now().isoformat()
@@ -248,8 +290,13 @@ def save_toc_to_json(toc_nodes, output_path, include_analytics=True):
     if include_analytics:
         toc_data['analytics'] = analyze_toc_tree(toc_nodes)
     
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(toc_data, f, indent=2, ensure_ascii=False)
+    if orjson is not None:
+        # Same layout as json.dump(indent=2, ensure_ascii=False), encoded natively to bytes
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(toc_data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(toc_data, f, indent=2, ensure_ascii=False)
     
     return output_path
 
@@ -260,6 +307,8 @@ def save_toc_to_json(toc_nodes, output_path, include_analytics=True):
 #########################################################
 
 class SearchSession:
+    EMB_CACHE_SIZE = 4096  # max cached subquery/page embeddings per session
+
     def __init__(self, query, config, corpus_dir=None, device="cpu",
                  retrieval_model="colpali", top_k=3, web_search_enabled=False,
                  personality=None, rag_model="gemma", max_depth=1, llm_provider="ollama", llm_model=None):
@@ -301,7 +350,8 @@ class SearchSession:
         # Load retrieval model.
         self.model, self.processor, self.model_type = load_retrieval_model(
             model_choice=self.retrieval_model,
-            device=self.device
+            device=self.device,
+            compile_model=self.config.get("compile_retrieval_model", False)
         )
         
         # For vision models, also load a fast text model for web content
@@ -310,17 +360,41 @@ class SearchSession:
             from sentence_transformers import SentenceTransformer
             self.text_model = SentenceTransformer("all-MiniLM-L6-v2", device=self.device)
 
-        # Compute the overall enhanced query embedding once.
-        print("[INFO] Computing embedding for enhanced query...")
+        # Half-precision page/subquery embeddings halve the per-entry tensors and cache entries;
+        # the KB matrix and relevance buffers are still fp32. Default on for CUDA only.
+        self.use_fp16 = self.config.get("use_fp16", self.device.startswith("cuda"))
+        self.emb_dtype = torch.float16 if self.use_fp16 else torch.float32
+
+        # Resolve the text encoder once: queries, subqueries and web pages all share it,
+        # so they land in the same embedding space. Returns unit-norm [N, D] rows.
         if self.model_type in ["siglip", "clip"] and self.text_model:
-            # Use text model for query embedding to match web content embeddings
-            self.enhanced_query_embedding = self.text_model.encode(self.enhanced_query, convert_to_tensor=True)
+            # Fast text model for web content; SigLIP/CLIP are only for vision tasks (images, PDFs)
+            text_model = self.text_model
+            self._encode_text = lambda texts: text_model.encode(texts, convert_to_tensor=True, batch_size=32, normalize_embeddings=True)
+            self._encoder_is_fp32 = True  # MiniLM is loaded in fp32
         else:
-            self.enhanced_query_embedding = embed_text(self.enhanced_query, self.model, self.processor, self.model_type, self.device)
+            # ColPali (masked mean over token embeddings), all-MiniLM, or SigLIP/CLIP text towers
+            model, processor, model_type, device = self.model, self.processor, self.model_type, self.device
+            self._encode_text = lambda texts: embed_texts(texts, model, processor, model_type, device)
+            # load_retrieval_model already picks bf16/fp16 weights for the transformers models
+            self._encoder_is_fp32 = self.model_type == "all-minilm"
+
+        # Compute the overall enhanced query embedding once.
+        print("[INFO] Computing embedding for enhanced query...")
+        # Same precision path as the subqueries/pages it is scored against
+        self.enhanced_query_embedding = self._encode_batch([self.enhanced_query])[0]
+        # Flat unit vector, normalized once so every relevance score is a single matmul
+        self.enhanced_query_embedding = F.normalize(self.enhanced_query_embedding.reshape(-1).float(), dim=-1)
+        # Reused scratch space for subquery scoring, so each recursion level does not allocate
+        max_batch = self.config.get("max_branch_batch", 64)
+        dim = self.enhanced_query_embedding.shape[-1]
+        self._score_buf = torch.empty((max_batch, dim), dtype=torch.float32, device=self.enhanced_query_embedding.device)
+        self._score_out = torch.empty((max_batch,), dtype=torch.float32, device=self.enhanced_query_embedding.device)
 
         # Create a knowledge base.
         print("[INFO] Creating KnowledgeBase...")
-        self.kb = KnowledgeBase(self.model, self.processor, model_type=self.model_type, device=self.device, text_model=self.text_model)
+        self.kb = KnowledgeBase(self.model, self.processor, model_type=self.model_type, device=self.device, text_model=self.text_model,
+                                quantize=self.config.get("quantize_embeddings", False))
 
         # Load local corpus if available.
         self.corpus = []
@@ -336,6 +410,79 @@ class SearchSession:
         self.local_results = []
         self.toc_tree = []  # List of TOCNode objects for the initial subqueries
         self.session_start_time = time.time()
+        # sha1 of text -> embedding; recursion re-surfaces the same subqueries and pages
+        self._emb_cache = {}
+        self._branch_semaphore = None  # created on first use, inside the running event loop
+        self._llm_semaphore = None
+
+    def _cached_embed(self, texts, encode):
+        """
+        Return one embedding (or None) per text, running 'encode' only on texts whose content
+        hash is not cached yet.
+        """
+        keys = [hashlib.sha1(t.encode("utf-8")).hexdigest() for t in texts]
+        found = {k: self._emb_cache[k] for k in keys if k in self._emb_cache}
+        missing = {}
+        for k, t in zip(keys, texts):
+            if k not in found:
+                missing.setdefault(k, t)
+        if missing:
+            for k, emb in zip(missing, encode(list(missing.values()))):
+                found[k] = emb
+                if emb is None:
+                    continue
+                if len(self._emb_cache) >= self.EMB_CACHE_SIZE:
+                    del self._emb_cache[next(iter(self._emb_cache))]  # FIFO eviction
+                self._emb_cache[k] = emb
+        return [found[k] for k in keys]
+
+    def _autocast(self):
+        """
+        fp16 autocast for fp32 encoders when use_fp16 is on and we run on CUDA.
+        Models loaded in bf16/fp16 (ColPali, SigLIP/CLIP) run as loaded: re-casting every op
+        is wasted work, and Gemma activations can overflow fp16.
+        """
+        if self.use_fp16 and self._encoder_is_fp32 and self.device.startswith("cuda"):
+            return torch.autocast(device_type="cuda", dtype=torch.float16)
+        return contextlib.nullcontext()
+
+    def _encode_batch(self, texts):
+        """Embed a batch of texts with the session encoder; returns [N, D] unit-norm rows in self.emb_dtype."""
+        with self._autocast():
+            embs = self._encode_text(texts)
+        return embs.to(self.emb_dtype)
+
+    def _embed_pages(self, texts, urls):
+        """
+        Batched _encode_batch with a per-page fallback: returns one embedding (or None) per text,
+        so one bad page does not drop the rest of the branch.
+        """
+        if not texts:
+            return []
+        try:
+            return list(self._encode_batch(texts))
+        except Exception as e:
+            print(f"[WARN] Batched page embedding failed, retrying one at a time: {e}")
+        embs = []
+        for text, url in zip(texts, urls):
+            try:
+                embs.append(self._encode_batch([text])[0])
+            except Exception as e:
+                print(f"[WARN] Error embedding page '{url}': {e}")
+                embs.append(None)
+        return embs
+
+    def _relevance_scores(self, embs):
+        """Cosine similarity of each row of an [N, D] tensor to the enhanced query, as a list of floats."""
+        n = embs.shape[0]
+        if n > self._score_buf.shape[0]:
+            embs = F.normalize(embs.float(), dim=-1).to(self.enhanced_query_embedding.device)
+            return (embs @ self.enhanced_query_embedding).tolist()
+        # Copy (and upcast) into the preallocated buffer, normalize in place, write scores into _score_out
+        buf = self._score_buf[:n]
+        buf.copy_(embs)
+        F.normalize(buf, dim=-1, out=buf)
+        return torch.mv(buf, self.enhanced_query_embedding, out=self._score_out[:n]).tolist()
 
     def _get_default_model(self, provider, rag_model):
         """Get default model for the specified provider."""
@@ -403,33 +550,33 @@ class SearchSession:
             'selected_queries': []
         }
         
-        for sq in subqueries:
-            sq_clean = clean_search_query(sq)
-            if not sq_clean:
-                continue
-            if self.model_type in ["siglip", "clip"] and self.text_model:
-                node_emb = self.text_model.encode(sq_clean, convert_to_tensor=True)
-            else:
-                node_emb = embed_text(sq_clean, self.model, self.processor, self.model_type, self.device)
-            score = late_interaction_score(self.enhanced_query_embedding, node_emb)
-            scored_subqs.append((sq_clean, score))
-            monte_carlo_metrics['candidate_scores'].append(score)
+        cleaned = [sq_clean for sq_clean in map(clean_search_query, subqueries) if sq_clean]
+        if cleaned:
+            # One batched forward + one matmul instead of a model call and a dot product per subquery
+            scores = self._relevance_scores(torch.stack(
+                self._cached_embed(cleaned, lambda b: list(self._encode_batch(b)))))
+            scored_subqs = list(zip(cleaned, scores))
+            monte_carlo_metrics['candidate_scores'] = scores
 
         if not scored_subqs:
             print("[WARN] No valid subqueries found for Monte Carlo. Returning original list.")
             return subqueries
 
-        # Weighted random choice
+        # Weighted random choice without replacement; cosine scores can be negative, which
+        # random.choices rejects, so clamp them and keep a tiny floor for all-zero weights
         weights = [s for (_, s) in scored_subqs]
         monte_carlo_metrics['selection_weights'] = weights
-        chosen = random.choices(
-            population=scored_subqs,
-            weights=weights,
-            k=min(max_subqs, len(scored_subqs))
-        )
+        w = torch.tensor(weights, dtype=torch.float32).clamp(min=0) + 1e-9
+        idx = torch.multinomial(w, num_samples=min(max_subqs, len(scored_subqs)), replacement=False).tolist()
+        chosen = [scored_subqs[i] for i in idx]
         # Return just the chosen subqueries
         chosen_sqs = [ch[0] for ch in chosen]
         monte_carlo_metrics['selected_queries'] = chosen_sqs
+        # query -> its own sampling weight, for tagging TOC nodes
+        weight_by_query = {}
+        for query, score in chosen:
+            weight_by_query.setdefault(query, score)
+        monte_carlo_metrics['selected_weight_by_query'] = weight_by_query
         monte_carlo_metrics['avg_candidate_score'] = sum(monte_carlo_metrics['candidate_scores']) / len(monte_carlo_metrics['candidate_scores'])
         monte_carlo_metrics['avg_selected_score'] = sum(score for _, score in chosen) / len(chosen)
         
@@ -450,163 +597,38 @@ class SearchSession:
         aggregated_corpus_entries = []
         toc_nodes = []
         min_relevance = self.config.get("min_relevance", 0.5)
-
-        for sq in subqueries:
-            sq_clean = clean_search_query(sq)
-            if not sq_clean:
-                continue
-
-            # Create a TOC node with enhanced tracking
-            toc_node = TOCNode(query_text=sq_clean, depth=current_depth)
-            toc_node.node_id = str(uuid.uuid4())[:8]
-            toc_node.timestamps['created'] = datetime.now().isoformat()
-            toc_node.parent_query = parent_query if parent_query else self.query
-            
-            # Relevance calculation with similarity tracking
-            if self.model_type in ["siglip", "clip"] and self.text_model:
-                node_embedding = self.text_model.encode(sq_clean, convert_to_tensor=True)
-            else:
-                node_embedding = embed_text(sq_clean, self.model, self.processor, self.model_type, self.device)
-            relevance = late_interaction_score(self.enhanced_query_embedding, node_embedding)
-            toc_node.relevance_score = relevance
-            toc_node.add_similarity_score(relevance)
-            
-            # Check if this node was selected by Monte Carlo
-            if hasattr(self, 'monte_carlo_metrics') and sq_clean in self.monte_carlo_metrics.get('selected_queries', []):
-                toc_node.metrics['monte_carlo_selected'] = True
-                # Find the weight for this query
-                for i, (query, score) in enumerate(zip(self.monte_carlo_metrics.get('selected_queries', []), 
-                                                      self.monte_carlo_metrics.get('selection_weights', []))):
-                    if query == sq_clean:
-                        toc_node.metrics['monte_carlo_weight'] = score
-                        break
-
-            if relevance < min_relevance:
-                print(f"[INFO] Skipping branch '{sq_clean}' due to low relevance ({relevance:.2f} < {min_relevance}).")
+        mc_weights = self.monte_carlo_metrics.get('selected_weight_by_query', {}) if hasattr(self, 'monte_carlo_metrics') else {}
+
+        # Embed every subquery at this level in one batch before fanning out
+        cleaned = [sq_clean for sq_clean in map(clean_search_query, subqueries) if sq_clean]
+        relevances = []
+        if cleaned:
+            relevances = self._relevance_scores(torch.stack(
+                self._cached_embed(cleaned, lambda b: list(self._encode_batch(b)))))
+
+        if self._branch_semaphore is None:
+            self._branch_semaphore = asyncio.Semaphore(self.config.get("branch_concurrency", 4))
+            self._llm_semaphore = asyncio.Semaphore(self.config.get("llm_concurrency", 2))
+        branches = await asyncio.gather(*(
+            self._process_branch(sq_clean, relevance, current_depth, parent_query, mc_weights, min_relevance)
+            for sq_clean, relevance in zip(cleaned, relevances)
+        ))
+        # gather keeps input order, so results line up with the subqueries as before
+        for branch in branches:
+            if branch is None:
                 continue
-
-            # Create subdirectory
-            safe_subquery = sanitize_filename(sq_clean)[:30]
-            subquery_dir = os.path.join(self.base_result_dir, f"web_{safe_subquery}")
-            os.makedirs(subquery_dir, exist_ok=True)
-            print(f"[DEBUG] Searching web for subquery '{sq_clean}' at depth={current_depth}...")
-
-            # Track web search timing
-            toc_node.timestamps['web_search_start'] = datetime.now().isoformat()
-            web_search_start = time.time()
-            
-            pages = await search_and_download(
-                keyword=sq_clean, 
-                out_dir=subquery_dir,
-                top_n=self.config.get("web_search_limit", 5),
-                concurrency=self.config.get("web_concurrency", 8),
-                include_wikipedia=self.config.get("include_wikipedia", False)
-            )
-            
-            web_search_end = time.time()
-            toc_node.timestamps['web_search_end'] = datetime.now().isoformat()
-            toc_node.metrics['processing_time_ms'] += int((web_search_end - web_search_start) * 1000)
-            branch_web_results = []
-            branch_corpus_entries = []
-            for page in pages:
-                if not page:
-                    continue
-                file_path = page.get("file_path")
-                url = page.get("url")
-                meta = page.get("meta", {})
-                if not file_path or not url:
-                    continue
-                
-                # Use the web crawler's robust parsing function
-                raw_text = parse_any_to_text(file_path)
-                if not raw_text.strip():
-                    continue
-                
-                # Use metadata from sidecar JSON if available, otherwise create snippet
-                snippet = meta.get("text_preview", raw_text[:100].replace('\n', ' ') + "...")
-                limited_text = raw_text[:2048]
-                
-                try:
-                    # For web content (HTML/text), always use fast text embeddings
-                    # SigLIP/CLIP are only for vision tasks (images, PDFs)
-                    if self.model_type in ["siglip", "clip"] and self.text_model:
-                        # Use pre-loaded fast text model for web content
-                        emb = self.text_model.encode(limited_text, convert_to_tensor=True)
-                    elif self.model_type == "colpali":
-                        inputs = self.processor(text=[limited_text], truncation=True, max_length=512, return_tensors="pt").to(self.device)
-                        outputs = self.model(**inputs)
-                        emb = outputs.embeddings.mean(dim=1).squeeze(0)
-                    else:
-                        # all-MiniLM or other text models
-                        emb = self.model.encode(limited_text, convert_to_tensor=True)
-                    
-                    entry = {
-                        "embedding": emb,
-                        "metadata": {
-                            "file_path": file_path,
-                            "type": "webhtml",
-                            "snippet": snippet,
-                            "url": url,
-                            "source_engine": meta.get("source_engine", "unknown"),
-                            "content_type": meta.get("content_type", ""),
-                            "size": meta.get("size", 0),
-                            "published_hint": meta.get("published_hint"),
-                            "downloaded_at": meta.get("downloaded_at")
-                        }
-                    }
-                    branch_corpus_entries.append(entry)
-                    branch_web_results.append({
-                        "url": url, 
-                        "snippet": snippet,
-                        "title": meta.get("title", ""),
-                        "source_engine": meta.get("source_engine", "unknown")
-                    })
-                except Exception as e:
-                    print(f"[WARN] Error embedding page '{url}': {e}")
-
-            # Summarize and update metrics
-            branch_snippets = " ".join([r.get("snippet", "") for r in branch_web_results])
-            summary_start = time.time()
-            toc_node.summary = self.llm_manager.summarize_text(branch_snippets)
-            summary_end = time.time()
-            toc_node.timestamps['summary_generated'] = datetime.now().isoformat()
-            toc_node.metrics['processing_time_ms'] += int((summary_end - summary_start) * 1000)
-            
-            # Update content metrics
-            toc_node.web_results = branch_web_results
-            toc_node.corpus_entries = branch_corpus_entries
-            toc_node.metrics['web_results_count'] = len(branch_web_results)
-            toc_node.metrics['corpus_entries_count'] = len(branch_corpus_entries)
-            toc_node.metrics['total_content_length'] = sum(len(r.get("snippet", "")) for r in branch_web_results)
-
-            additional_subqueries = []
-            if current_depth < self.max_depth:
-                additional_query = self.llm_manager.enhance_query(sq_clean)
-                if additional_query and additional_query != sq_clean:
-                    additional_subqueries = split_query(additional_query, max_len=self.config.get("max_query_length", 200))
-
-            if additional_subqueries:
-                toc_node.metrics['subquery_expansion_count'] = len(additional_subqueries)
-                deeper_web_results, deeper_corpus_entries, _, deeper_toc_nodes = await self.perform_recursive_web_searches(additional_subqueries, current_depth=current_depth+1, parent_query=sq_clean)
-                branch_web_results.extend(deeper_web_results)
-                branch_corpus_entries.extend(deeper_corpus_entries)
-                for child_node in deeper_toc_nodes:
-                    toc_node.add_child(child_node)
-
-            # Mark node as completed
-            toc_node.timestamps['completed'] = datetime.now().isoformat()
-            
+            toc_node, branch_web_results, branch_corpus_entries = branch
             aggregated_web_results.extend(branch_web_results)
             aggregated_corpus_entries.extend(branch_corpus_entries)
             toc_nodes.append(toc_node)
 
-        # Group results by domain for reporting
+        # Group results by domain for reporting (each distinct URL is parsed once)
+        domains = {url: urlparse(url).netloc for url in {r.get("url", "") for r in aggregated_web_results} if url}
         grouped = {}
         for r, e in zip(aggregated_web_results, aggregated_corpus_entries):
             url = r.get("url", "")
             if url:
-                from urllib.parse import urlparse
-                domain = urlparse(url).netloc
+                domain = domains[url]
                 if domain not in grouped:
                     grouped[domain] = []
                 grouped[domain].append({
@@ -618,6 +640,141 @@ class SearchSession:
                 })
         return aggregated_web_results, aggregated_corpus_entries, grouped, toc_nodes
 
+    async def _process_branch(self, sq_clean, relevance, current_depth, parent_query, mc_weights, min_relevance):
+        """
+        Search, embed and summarize one subquery branch, recursing into its expansions.
+        Returns (toc_node, branch_web_results, branch_corpus_entries), or None if the branch is skipped.
+        """
+        loop = asyncio.get_running_loop()
+        # Create a TOC node with enhanced tracking
+        toc_node = TOCNode(query_text=sq_clean, depth=current_depth)
+        toc_node.node_id = str(uuid.uuid4())[:8]
+        toc_node.timestamps['created'] = datetime.now().isoformat()
+        toc_node.parent_query = parent_query if parent_query else self.query
+
+        # Relevance calculation with similarity tracking
+        toc_node.relevance_score = relevance
+        toc_node.add_similarity_score(relevance)
+
+        # Check if this node was selected by Monte Carlo
+        if sq_clean in mc_weights:
+            toc_node.metrics['monte_carlo_selected'] = True
+            toc_node.metrics['monte_carlo_weight'] = mc_weights[sq_clean]
+
+        if relevance < min_relevance:
+            print(f"[INFO] Skipping branch '{sq_clean}' due to low relevance ({relevance:.2f} < {min_relevance}).")
+            return None
+
+        # Create subdirectory; the node id keeps concurrent branches with colliding names apart
+        safe_subquery = sanitize_filename(sq_clean)[:30]
+        subquery_dir = os.path.join(self.base_result_dir, f"web_{safe_subquery}_{toc_node.node_id}")
+        os.makedirs(subquery_dir, exist_ok=True)
+        print(f"[DEBUG] Searching web for subquery '{sq_clean}' at depth={current_depth}...")
+
+        # Sibling branches run concurrently; the semaphore caps simultaneous searches
+        async with self._branch_semaphore:
+            # Track web search timing (after acquiring, so queueing time is not counted)
+            toc_node.timestamps['web_search_start'] = datetime.now().isoformat()
+            web_search_start = time.time()
+            pages = await search_and_download(
+                keyword=sq_clean, 
+                out_dir=subquery_dir,
+                top_n=self.config.get("web_search_limit", 5),
+                concurrency=self.config.get("web_concurrency", 8),
+                include_wikipedia=self.config.get("include_wikipedia", False)
+            )
+
+        web_search_end = time.time()
+        toc_node.timestamps['web_search_end'] = datetime.now().isoformat()
+        toc_node.metrics['processing_time_ms'] += int((web_search_end - web_search_start) * 1000)
+        branch_web_results = []
+        branch_corpus_entries = []
+        # Gather pass: parse every page first so the branch is embedded in one batch
+        parsed = []
+        for page in pages:
+            if not page:
+                continue
+            file_path = page.get("file_path")
+            url = page.get("url")
+            meta = page.get("meta", {})
+            if not file_path or not url:
+                continue
+
+            # Use the web crawler's robust parsing function
+            raw_text = parse_any_to_text(file_path)
+            if not raw_text.strip():
+                continue
+
+            # Use metadata from sidecar JSON if available, otherwise create snippet
+            snippet = meta.get("text_preview", raw_text[:100].replace('\n', ' ') + "...")
+            parsed.append((file_path, url, meta, snippet, raw_text[:2048]))
+
+        url_by_text = {p[4]: p[1] for p in parsed}
+        page_embs = self._cached_embed(
+            [p[4] for p in parsed],
+            lambda b: self._embed_pages(b, [url_by_text[t] for t in b]))
+        for (file_path, url, meta, snippet, _), emb in zip(parsed, page_embs):
+            if emb is None:
+                continue
+            entry = {
+                "embedding": emb,
+                "metadata": {
+                    "file_path": file_path,
+                    "type": "webhtml",
+                    "snippet": snippet,
+                    "url": url,
+                    "source_engine": meta.get("source_engine", "unknown"),
+                    "content_type": meta.get("content_type", ""),
+                    "size": meta.get("size", 0),
+                    "published_hint": meta.get("published_hint"),
+                    "downloaded_at": meta.get("downloaded_at")
+                }
+            }
+            branch_corpus_entries.append(entry)
+            branch_web_results.append({
+                "url": url, 
+                "snippet": snippet,
+                "title": meta.get("title", ""),
+                "source_engine": meta.get("source_engine", "unknown")
+            })
+
+        # Summarize and update metrics
+        branch_snippets = " ".join([r.get("snippet", "") for r in branch_web_results])
+        # LLM calls are blocking; run them in a worker thread so other branches keep going,
+        # with at most llm_concurrency of them in flight
+        async with self._llm_semaphore:
+            summary_start = time.time()
+            toc_node.summary = await loop.run_in_executor(None, self.llm_manager.summarize_text, branch_snippets)
+        summary_end = time.time()
+        toc_node.timestamps['summary_generated'] = datetime.now().isoformat()
+        toc_node.metrics['processing_time_ms'] += int((summary_end - summary_start) * 1000)
+
+        # Update content metrics
+        toc_node.web_results = branch_web_results
+        toc_node.corpus_entries = branch_corpus_entries
+        toc_node.metrics['web_results_count'] = len(branch_web_results)
+        toc_node.metrics['corpus_entries_count'] = len(branch_corpus_entries)
+        toc_node.metrics['total_content_length'] = sum(len(r.get("snippet", "")) for r in branch_web_results)
+
+        additional_subqueries = []
+        if current_depth < self.max_depth:
+            async with self._llm_semaphore:
+                additional_query = await loop.run_in_executor(None, self.llm_manager.enhance_query, sq_clean)
+            if additional_query and additional_query != sq_clean:
+                additional_subqueries = split_query(additional_query, max_len=self.config.get("max_query_length", 200))
+
+        if additional_subqueries:
+            toc_node.metrics['subquery_expansion_count'] = len(additional_subqueries)
+            deeper_web_results, deeper_corpus_entries, _, deeper_toc_nodes = await self.perform_recursive_web_searches(additional_subqueries, current_depth=current_depth+1, parent_query=sq_clean)
+            branch_web_results.extend(deeper_web_results)
+            branch_corpus_entries.extend(deeper_corpus_entries)
+            for child_node in deeper_toc_nodes:
+                toc_node.add_child(child_node)
+
+        # Mark node as completed
+        toc_node.timestamps['completed'] = datetime.now().isoformat()
+        return toc_node, branch_web_results, branch_corpus_entries
+
     def _summarize_web_results(self, web_results):
         lines = []
         reference_urls = []
@@ -216,6 +216,9 @@ class SearxNGEngine(BaseEngine):
         "https://nx.tcit.fr/searx",
     ]
 
+    # RECENCY_WINDOWS code -> SearxNG time_range value
+    TIME_RANGES = {"d": "day", "w": "week", "m": "month"}
+
     def __init__(self, endpoints: Optional[List[str]] = None, timeout: float = 8.0):
         self.endpoints = endpoints or self.DEFAULT_ENDPOINTS
         self.timeout = timeout
@@ -260,7 +263,7 @@ class SearxNGEngine(BaseEngine):
                     "language": "en",
                 }
                 if tl:
-                    params["time_range"] = {"d": "day", "w": "week", "m": "month"}.get(tl, "")
+                    params["time_range"] = self.TIME_RANGES.get(tl, "")
                 url = base + "/search"
                 try:
                     async with session.get(url, params=params) as r:
@@ -432,7 +435,7 @@ def try_parse_date(text: str) -> Optional[datetime]:
         return None
 
 
-def score_result(item: SearchResult, keyword: str) -> float:
+def score_result(item: SearchResult, keyword: str, now: Optional[datetime] = None) -> float:
     href = item.href or ""
     title = (item.title or "").lower()
     body = (item.body or "").lower()
@@ -455,7 +458,7 @@ def score_result(item: SearchResult, keyword: str) -> float:
         dt = try_parse_date(body) or try_parse_date(title)
     recency = 0.0
     if dt:
-        days = max(1, (datetime.utcnow() - dt).days)
+        days = max(1, ((now or datetime.utcnow()) - dt).days)
         if days < 30:
             recency = 2.0
         elif days < 180:
@@ -472,8 +475,9 @@ def rerank(results: List[SearchResult], keyword: str, per_domain_cap: int = 3) -
         if r.href and r.href not in seen:
             seen.add(r.href)
             deduped.append(r)
-    # score
-    deduped.sort(key=lambda r: score_result(r, keyword), reverse=True)
+    # score (one clock read for the whole batch)
+    now = datetime.utcnow()
+    deduped.sort(key=lambda r: score_result(r, keyword, now), reverse=True)
     # diversity
     out, counts = [], {}
     for r in deduped:
@@ -510,6 +514,11 @@ async def robots_allowed(session: aiohttp.ClientSession, url: str, user_agent: s
     return True if rp is None else rp.can_fetch(user_agent, url)
 
 
+def _write_bytes(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+
 async def fetch_one(session: aiohttp.ClientSession, url: str, dest_dir: str,
                     max_bytes: int = 8_000_000, tries: int = 3) -> Optional[Dict[str, Any]]:
     if not await robots_allowed(session, url):
@@ -542,8 +551,9 @@ async def fetch_one(session: aiohttp.ClientSession, url: str, dest_dir: str,
                     return None
                 fname = f"{url_hash(url)}{ext}"
                 fpath = os.path.join(dest_dir, fname)
-                with open(fpath, "wb") as f:
-                    f.write(raw)
+                # Disk write is blocking; keep it off the event loop so other downloads keep flowing
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, _write_bytes, fpath, raw)
                 return {"url": url, "file_path": fpath, "content_type": ctype, "size": len(raw)}
         except Exception as e:
             await asyncio.sleep(backoff + random.random() * 0.2)